@@ -4,5 +4,15 @@ __author__ = """Martin Arrogante"""
 __email__ = "arrogantemartin@gmail.com"
 __version__ = "0.1.2"
 
-from road_flood_risk_map.road_flood_risk_map import RoadFloodRiskMap
-from road_flood_risk_map.common import compute_d8_direction, fill_depressions, fill_depressions_flow_dirs, fill_depression_epsilon
\ No newline at end of file
+from road_flood_risk_map.common import DEMArrays, compute_d8_direction, fill_depressions, fill_depressions_parallel, fill_depressions_flow_dirs, fill_depression_epsilon, quantize_dem, dequantize_dem, resolve_flats
+
+
+def __getattr__(name):
+    # RoadFloodRiskMap pulls in geemap, ee, whitebox_workflows and IPython. It is
+    # imported on first access so that importing `common` alone, as the spawned
+    # workers of `fill_depressions_parallel` do, stays cheap.
+    if name == "RoadFloodRiskMap":
+        from road_flood_risk_map.road_flood_risk_map import RoadFloodRiskMap
+
+        return RoadFloodRiskMap
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,196 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""Compiled D8 and Priority-Flood kernels, used in place of the numba ones when built."""
+
+cimport cython
+from cython.parallel cimport prange
+from libc.math cimport INFINITY, isnan
+
+import numpy as np
+
+# D8 neighbour offsets as (row, column), ordered NW, N, NE, E, SE, S, SW, W to
+# line up with the ESRI direction codes, as in `common`.
+cdef int DI[8]
+cdef int DJ[8]
+cdef int CODE[8]
+cdef float INV_DIST[8]
+DI[:] = [-1, -1, -1, 0, 1, 1, 1, 0]
+DJ[:] = [-1, 0, 1, 1, 1, 0, -1, -1]
+CODE[:] = [32, 64, 128, 1, 2, 4, 8, 16]
+cdef float C_DIAG = 70.71067811865476
+cdef float C_CARD = 100.0
+INV_DIST[:] = [C_DIAG, C_CARD, C_DIAG, C_CARD, C_DIAG, C_CARD, C_DIAG, C_CARD]
+
+
+cdef inline int _d8_cell(
+    const float[:, ::1] elev, Py_ssize_t i, Py_ssize_t j
+) noexcept nogil:
+    """D8 code of a single cell, with bounds checks for the raster border."""
+    cdef Py_ssize_t rows = elev.shape[0], cols = elev.shape[1], ni, nj
+    cdef float z = elev[i, j], best = -INFINITY, drop
+    cdef int k, code = -1
+    if isnan(z):
+        return -1
+    for k in range(8):
+        ni = i + DI[k]
+        nj = j + DJ[k]
+        if 0 <= ni < rows and 0 <= nj < cols:
+            drop = (z - elev[ni, nj]) * INV_DIST[k]
+            if drop > best:
+                best = drop
+                code = CODE[k]
+    return code
+
+
+def compute_d8(const float[:, ::1] elev, int[:, ::1] out):
+    """Fill `out` with the D8 codes of a float32 DEM with NaN nodata."""
+    cdef Py_ssize_t rows = elev.shape[0], cols = elev.shape[1], i, j
+    cdef float z, d, best
+    cdef int code
+    for i in prange(rows, nogil=True, schedule="static"):
+        if i == 0 or i == rows - 1:
+            for j in range(cols):
+                out[i, j] = _d8_cell(elev, i, j)
+            continue
+        out[i, 0] = _d8_cell(elev, i, 0)
+        out[i, cols - 1] = _d8_cell(elev, i, cols - 1)
+        for j in range(1, cols - 1):
+            # NaN drops never compare greater, so nodata cells end up as -1
+            z = elev[i, j]
+            best = -INFINITY
+            code = -1
+            d = (z - elev[i - 1, j - 1]) * C_DIAG
+            if d > best:
+                best = d
+                code = 32
+            d = (z - elev[i - 1, j]) * C_CARD
+            if d > best:
+                best = d
+                code = 64
+            d = (z - elev[i - 1, j + 1]) * C_DIAG
+            if d > best:
+                best = d
+                code = 128
+            d = (z - elev[i, j + 1]) * C_CARD
+            if d > best:
+                best = d
+                code = 1
+            d = (z - elev[i + 1, j + 1]) * C_DIAG
+            if d > best:
+                best = d
+                code = 2
+            d = (z - elev[i + 1, j]) * C_CARD
+            if d > best:
+                best = d
+                code = 4
+            d = (z - elev[i + 1, j - 1]) * C_DIAG
+            if d > best:
+                best = d
+                code = 8
+            d = (z - elev[i, j - 1]) * C_CARD
+            if d > best:
+                code = 16
+            out[i, j] = code
+
+
+cdef inline Py_ssize_t _heap_push(
+    float *keys, int *values, Py_ssize_t size, float key, int value
+) noexcept nogil:
+    """Push onto the binary min-heap stored in `keys`/`values`; return the new size."""
+    cdef Py_ssize_t pos = size, parent
+    while pos > 0:
+        parent = (pos - 1) >> 1
+        if keys[parent] <= key:
+            break
+        keys[pos] = keys[parent]
+        values[pos] = values[parent]
+        pos = parent
+    keys[pos] = key
+    values[pos] = value
+    return size + 1
+
+
+cdef inline Py_ssize_t _heap_pop(
+    float *keys, int *values, Py_ssize_t size, int *value
+) noexcept nogil:
+    """Pop the minimum of the binary heap into `value`; return the new size."""
+    cdef Py_ssize_t pos = 0, child
+    cdef float last_key
+    cdef int last_value
+    value[0] = values[0]
+    size -= 1
+    last_key = keys[size]
+    last_value = values[size]
+    while True:
+        child = 2 * pos + 1
+        if child >= size:
+            break
+        if child + 1 < size and keys[child + 1] < keys[child]:
+            child += 1
+        if last_key <= keys[child]:
+            break
+        keys[pos] = keys[child]
+        values[pos] = values[child]
+        pos = child
+    keys[pos] = last_key
+    values[pos] = last_value
+    return size
+
+
+def priority_flood(float[::1] dem_flat, Py_ssize_t rows, Py_ssize_t cols):
+    """Priority-Flood over a row-major flattened float32 DEM, filling it in place."""
+    cdef Py_ssize_t n = rows * cols
+    if n == 0:
+        return
+    cdef float[::1] heap_keys = np.empty(n, dtype=np.float32)
+    cdef int[::1] heap_idx = np.empty(n, dtype=np.int32)
+    cdef int[::1] pits = np.empty(n, dtype=np.int32)
+    cdef unsigned char[::1] closed = np.zeros(n, dtype=np.uint8)
+    cdef float *keys = &heap_keys[0]
+    cdef int *values = &heap_idx[0]
+    cdef Py_ssize_t heap_size = 0, head = 0, tail = 0, i, j, ni, nj
+    cdef int idx, nidx, k
+    cdef float z
+
+    with nogil:
+        # NaN (nodata) cells drain freely, so they start in the pit buffer
+        for idx in range(n):
+            if isnan(dem_flat[idx]):
+                closed[idx] = 1
+                pits[tail] = idx
+                tail += 1
+
+        # Seed the heap with the border cells
+        for idx in range(n):
+            if closed[idx]:
+                continue
+            i = idx // cols
+            j = idx - i * cols
+            if i == 0 or i == rows - 1 or j == 0 or j == cols - 1:
+                closed[idx] = 1
+                heap_size = _heap_push(keys, values, heap_size, dem_flat[idx], idx)
+
+        while head < tail or heap_size > 0:
+            if head < tail:
+                idx = pits[head]
+                head += 1
+            else:
+                heap_size = _heap_pop(keys, values, heap_size, &idx)
+            # Pits have already been raised, so this is the current spill level
+            z = dem_flat[idx]
+            i = idx // cols
+            j = idx - i * cols
+            for k in range(8):
+                ni = i + DI[k]
+                nj = j + DJ[k]
+                if ni < 0 or ni >= rows or nj < 0 or nj >= cols:
+                    continue
+                nidx = <int>(ni * cols + nj)
+                if closed[nidx]:
+                    continue
+                closed[nidx] = 1
+                if dem_flat[nidx] <= z:
+                    dem_flat[nidx] = z
+                    pits[tail] = nidx
+                    tail += 1
+                else:
+                    heap_size = _heap_push(keys, values, heap_size, dem_flat[nidx], nidx)
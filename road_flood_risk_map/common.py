@@ -1,136 +1,1071 @@
 """The common module contains common functions and classes used by the other modules."""
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+import heapq
+import multiprocessing
+from multiprocessing import shared_memory
+
 import numpy as np
 
+try:
+    from numba import njit, prange
+
+    _HAS_NUMBA = True
+except ImportError:  # pragma: no cover - numba is an optional dependency
+    _HAS_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Stand-in for `numba.njit` that leaves the function as plain Python."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# The Cython build of the D8 and Priority-Flood kernels is preferred when present,
+# then numba, then the NumPy / pure Python fallbacks.
+try:
+    from road_flood_risk_map import _hydro
+except ImportError:  # pragma: no cover - the extension is built by setup.py
+    _hydro = None
+
+
+# D8 neighbour offsets as (row, column), ordered NW, N, NE, E, SE, S, SW, W so
+# that they line up with the ESRI direction codes in ``_D8_CODE``.
+_D8_DI = np.array([-1, -1, -1, 0, 1, 1, 1, 0])
+_D8_DJ = np.array([-1, 0, 1, 1, 1, 0, -1, -1])
+_D8_CODE = np.array([32, 64, 128, 1, 2, 4, 8, 16], dtype=np.int32)
+# 100 / distance to each neighbour, so that drop = change_in_z * _D8_INV_DIST.
+_D8_INV_DIST = (100.0 / np.hypot(_D8_DI, _D8_DJ)).astype(np.float32)
+_D8_C_DIAG = _D8_INV_DIST[0]
+_D8_C_CARD = _D8_INV_DIST[1]
+# The same offsets as plain Python ints, for the pure Python loops.
+_D8_OFFSETS = list(zip(_D8_DI.tolist(), _D8_DJ.tolist()))
+
+# LLVM fast-math flags minus "nnan"/"ninf": NaN marks nodata cells and the
+# comparisons against it must keep their IEEE semantics.
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# Rows per D8 block. Each block plus its one-row halo is swept while it is
+# still cache resident instead of streaming the whole raster through the stencil.
+_D8_BLOCK_ROWS = 256
+
+
+def _as_float32_dem(dem, nodata_value=np.nan):
+    """Return `dem` as a C-contiguous float32 array with nodata cells set to NaN."""
+    elev = np.ascontiguousarray(dem, dtype=np.float32)
+    if not np.isnan(nodata_value):
+        nodata = elev == nodata_value
+        if nodata.any():
+            elev = np.where(nodata, np.float32(np.nan), elev)
+    return elev
+
 
 def compute_d8_direction(dem, nodata_value=np.nan):
-    """Compute D8 flow direction from a DEM."""
-    # Placeholder for D8 direction computation logic
-    # This should return a numpy array of the same shape as dem
-    # with values indicating the flow direction.
-    direction_code = {
-        32: (-1, -1),  # 0: North-West
-        64: (-1, 0),  # 1: North
-        128: (-1, 1),  # 2: North-East
-        1: (0, 1),  # 3: East
-        2: (1, 1),  # 4: South-East
-        4: (0, 1),  # 5: South
-        8: (1, -1),  # 6: South-West
-        16: (0, -1),  # 7: West
-    }
-    d8_direction = np.zeros_like(dem, dtype=np.int32)
-    rows, cols = dem.shape
-    for i in range(0, rows):
-        for j in range(0, cols):
-            if dem[i, j] == nodata_value:  # Assuming -9999 is the nodata value
-                d8_direction[i, j] = nodata_value
-            else:
-                # Compute the direction based on the surrounding cells
-                maximum_drop = -np.inf
-                elev = dem[i, j]
-                direction = -1
-                for k, (di, dj) in direction_code.items():
-                    ni, nj = i + di, j + dj
-                    if 0 <= ni < rows and 0 <= nj < cols:
-                        # maximum_drop = change_in_z-value / distance * 100
-                        change_in_z = elev - dem[ni, nj]
-                        distance = np.sqrt(di**2 + dj**2)
-                        drop = (change_in_z / distance * 100) if distance != 0 else 0
-                        if drop > maximum_drop:
-                            maximum_drop = drop
-                            direction = k
-                d8_direction[i, j] = direction
+    """
+    Compute D8 flow direction from a DEM.
+
+    Each cell points to the neighbour with the steepest downslope drop, using the
+    ESRI direction codes (1=E, 2=SE, 4=S, 8=SW, 16=W, 32=NW, 64=N, 128=NE).
+
+    Args:
+        dem (numpy.ndarray): 2D array of elevations.
+        nodata_value (float): Value marking nodata cells. NaN cells are always
+            treated as nodata.
+
+    Returns:
+        d8_direction (numpy.ndarray): int32 array of direction codes. Nodata cells
+            and cells without a valid neighbour are set to -1.
+    """
+    # The DEM is processed as contiguous float32 with NaN marking nodata
+    elev = _as_float32_dem(dem, nodata_value)
+    d8_direction = np.empty(elev.shape, dtype=np.int32)
+    _d8_float32(elev, d8_direction)
     return d8_direction
 
 
-def fill_depressions(dem):
+def _d8_float32(elev, out):
+    """Write the D8 codes of a float32 DEM with NaN nodata into `out`."""
+    if _hydro is not None:
+        _hydro.compute_d8(elev, out)
+    elif _HAS_NUMBA:
+        rows = elev.shape[0]
+        for i0 in range(0, rows, _D8_BLOCK_ROWS):
+            i1 = min(rows, i0 + _D8_BLOCK_ROWS)
+            halo_top = 1 if i0 > 0 else 0
+            _d8_kernel(elev[i0 - halo_top : i1 + 1], out[i0:i1], halo_top)
+    else:
+        out[...] = _d8_numpy(elev)
+
+
+def _d8_numpy(elev):
+    """Vectorized D8 fallback used when numba is not available."""
+    rows, cols = elev.shape
+    # Out-of-bounds and nodata neighbours both become NaN and never win argmax.
+    padded = np.pad(elev, 1, constant_values=np.nan)
+    drops = np.empty((8, rows, cols), dtype=elev.dtype)
+    for k in range(8):
+        di, dj = int(_D8_DI[k]), int(_D8_DJ[k])
+        neighbour = padded[1 + di : 1 + di + rows, 1 + dj : 1 + dj + cols]
+        np.multiply(elev - neighbour, _D8_INV_DIST[k], out=drops[k])
+    drops[np.isnan(drops)] = -np.inf
+
+    d8_direction = _D8_CODE[drops.argmax(axis=0)]
+    d8_direction[np.isneginf(drops).all(axis=0)] = -1
+    return d8_direction
+
+
+@njit(cache=True)
+def _d8_cell(elev, i, j):
+    """D8 code of a single cell, with bounds checks for the raster border."""
+    rows, cols = elev.shape
+    z = elev[i, j]
+    if np.isnan(z):
+        return -1
+    best = -np.inf
+    code = -1
+    for k in range(8):
+        ni = i + _D8_DI[k]
+        nj = j + _D8_DJ[k]
+        if 0 <= ni < rows and 0 <= nj < cols:
+            drop = (z - elev[ni, nj]) * _D8_INV_DIST[k]
+            if drop > best:
+                best = drop
+                code = _D8_CODE[k]
+    return code
+
+
+@njit(inline="always")
+def _keep_steeper(best, code, drop, drop_code):
+    """Branch-free max-with-argmax step; NaN drops never win."""
+    steeper = drop > best
+    return (drop if steeper else best), (drop_code if steeper else code)
+
+
+@njit(parallel=True, fastmath=_FASTMATH, cache=True)
+def _d8_kernel(elev, out, top):
     """
-    Fill depressions in a DEM using a simple algorithm.
+    Fill `out` with the D8 codes of a block of rows in a single pass.
+
+    `elev` holds the block plus up to one halo row above and below it, and row
+    ``top`` of `elev` is the first row of `out`. Rows without a halo are the
+    raster border.
     """
-    import heapq
-    import numpy as np
-    import queue
+    rows, cols = elev.shape
+    for r in prange(out.shape[0]):
+        i = r + top
+        if i == 0 or i == rows - 1:
+            for j in range(cols):
+                out[r, j] = _d8_cell(elev, i, j)
+            continue
+        out[r, 0] = _d8_cell(elev, i, 0)
+        out[r, cols - 1] = _d8_cell(elev, i, cols - 1)
+        for j in range(1, cols - 1):
+            # Straight-line code so LLVM can lower the folds below to selects.
+            # A NaN cell gives NaN drops everywhere and therefore code -1.
+            z = elev[i, j]
+            d0 = (z - elev[i - 1, j - 1]) * _D8_C_DIAG
+            d1 = (z - elev[i - 1, j]) * _D8_C_CARD
+            d2 = (z - elev[i - 1, j + 1]) * _D8_C_DIAG
+            d3 = (z - elev[i, j + 1]) * _D8_C_CARD
+            d4 = (z - elev[i + 1, j + 1]) * _D8_C_DIAG
+            d5 = (z - elev[i + 1, j]) * _D8_C_CARD
+            d6 = (z - elev[i + 1, j - 1]) * _D8_C_DIAG
+            d7 = (z - elev[i, j - 1]) * _D8_C_CARD
 
-    filled_dem = dem.copy()
-    rows, cols = dem.shape
-    open_pq = []
-    pits = queue.Queue()
-    closed_set = np.zeros((rows, cols), dtype=bool)
+            best, code = _keep_steeper(np.float32(-np.inf), -1, d0, 32)  # NW
+            best, code = _keep_steeper(best, code, d1, 64)  # N
+            best, code = _keep_steeper(best, code, d2, 128)  # NE
+            best, code = _keep_steeper(best, code, d3, 1)  # E
+            best, code = _keep_steeper(best, code, d4, 2)  # SE
+            best, code = _keep_steeper(best, code, d5, 4)  # S
+            best, code = _keep_steeper(best, code, d6, 8)  # SW
+            best, code = _keep_steeper(best, code, d7, 16)  # W
+            out[r, j] = code
 
-    neighbors = [
-        (-1, 0),  # North
-        (1, 0),  # South
-        (0, -1),  # West
-        (0, 1),  # East
-        (-1, -1),  # Northwest
-        (-1, 1),  # Northeast
-        (1, -1),  # Southwest
-        (1, 1),  # Southeast
-    ]
 
-    # Initialize the priority queue with border cells
-    for i in range(rows):
-        heapq.heappush(open_pq, (dem[i, 0], (i, 0)))
-        heapq.heappush(open_pq, (dem[i, cols - 1], (i, cols - 1)))
-        closed_set[i, 0] = True
-        closed_set[i, cols - 1] = True
+def fill_depressions(dem, nodata_value=np.nan, tile_size=None):
+    """
+    Fill depressions in a DEM using the Priority-Flood algorithm (Barnes et al., 2014).
 
-    for j in range(1, cols - 1):
-        heapq.heappush(open_pq, (dem[0, j], (0, j)))
-        heapq.heappush(open_pq, (dem[rows - 1, j], (rows - 1, j)))
-        closed_set[0, j] = True
-        closed_set[rows - 1, j] = True
+    Cells are flooded inwards from the raster border and from nodata cells in order
+    of elevation. Cells that are lower than the cell they were reached from are
+    raised to its level and processed through a FIFO queue of pits.
 
-    while open_pq or not pits.empty():
-        current = None
-        if not pits.empty():
-            current = pits.get()
+    When numba is installed the flood runs in a compiled kernel over flat cell
+    indices. Otherwise a pure Python version is used. Integer DEMs use a monotone
+    bucket queue (one list per elevation) in either case, so every queue operation
+    is O(1) and the fill is linear in the number of cells; float DEMs use a binary
+    heap.
+
+    If `tile_size` is given, the DEM is split into square tiles that are flooded
+    independently on a thread pool and then reconciled through the graph of tile
+    border cells (Barnes, 2016). The result is identical to the untiled fill.
+
+    Args:
+        dem (numpy.ndarray): 2D array of elevations.
+        nodata_value (float): Value marking nodata cells. NaN cells are always
+            treated as nodata.
+        tile_size (int | None): Side length of the tiles in cells. If None, the
+            DEM is filled in a single pass.
+
+    Returns:
+        filled_dem (numpy.ndarray): float32 copy of `dem` with all depressions
+            filled. Nodata cells keep `nodata_value`.
+    """
+    filled_dem = np.array(_as_float32_dem(dem, nodata_value))
+    if tile_size:
+        labels = np.empty(filled_dem.shape, dtype=np.int32)
+        flood = partial(_flood_tile_into, filled_dem, labels)
+        with ThreadPoolExecutor() as executor:
+            _fill_tiled(
+                filled_dem,
+                labels,
+                tile_size,
+                lambda bounds: executor.map(flood, bounds),
+            )
+    else:
+        integer_dem = np.issubdtype(np.asarray(dem).dtype, np.integer)
+        _fill_float32(filled_dem, integer_dem)
+    if not np.isnan(nodata_value):
+        filled_dem[np.isnan(filled_dem)] = nodata_value
+    return filled_dem
+
+
+def _fill_float32(elev, integer_dem=False):
+    """Fill a float32 DEM with NaN nodata in place."""
+    levels = _bucket_levels(elev) if integer_dem else None
+    if levels is not None and _HAS_NUMBA:
+        rows, cols = elev.shape
+        _priority_flood_buckets(elev.ravel(), rows, cols, *levels)
+    elif _hydro is not None:
+        rows, cols = elev.shape
+        _hydro.priority_flood(elev.ravel(), rows, cols)
+    elif _HAS_NUMBA:
+        rows, cols = elev.shape
+        _priority_flood(elev.ravel(), rows, cols)
+    else:
+        _fill_depressions_python(elev, levels is not None)
+
+
+def _bucket_levels(elev):
+    """
+    Return the (min_z, n_levels) range for a bucket queue over `elev`.
+
+    Returns None when there are more elevation levels than cells, where the
+    buckets would cost more to sweep than a heap.
+    """
+    valid = elev[~np.isnan(elev)]
+    if valid.size == 0:
+        return None
+    min_z = int(valid.min())
+    n_levels = int(valid.max()) - min_z + 1
+    if n_levels > elev.size:
+        return None
+    return min_z, n_levels
+
+
+class MonotoneBucketQueue:
+    """
+    Priority queue for integer keys that are popped in non-decreasing order.
+
+    Keeps one list per key between `min_z` and `max_z` and a cursor at the lowest
+    level that may still hold items, so `push` and `pop_min` are O(1) amortized.
+    Keys pushed below the cursor are not supported, which Priority-Flood never
+    does.
+
+    Args:
+        min_z (int): Smallest key that will be pushed.
+        max_z (int): Largest key that will be pushed.
+    """
+
+    def __init__(self, min_z, max_z):
+        self.min_z = min_z
+        self.buckets = [[] for _ in range(max_z - min_z + 1)]
+        self.current_level = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, z, idx):
+        """Add `idx` with the integer key `z`."""
+        self.buckets[int(z) - self.min_z].append(idx)
+        self._size += 1
+
+    def pop_min(self):
+        """Remove and return the (key, idx) pair with the lowest key."""
+        if not self._size:
+            raise IndexError("pop from an empty MonotoneBucketQueue")
+        while not self.buckets[self.current_level]:
+            self.current_level += 1
+        self._size -= 1
+        return (
+            self.current_level + self.min_z,
+            self.buckets[self.current_level].pop(),
+        )
+
+
+def _fill_depressions_python(filled_dem, integer_dem=False):
+    """Pure Python Priority-Flood used when numba is not available."""
+    rows, cols = filled_dem.shape
+    if filled_dem.size == 0:
+        return filled_dem
+    closed_set = np.isnan(filled_dem)
+
+    # Nodata cells drain freely, so they are processed first as -inf pits.
+    # Cells are kept as flat row-major indices rather than (i, j) tuples.
+    pits = deque((-np.inf, idx) for idx in np.flatnonzero(closed_set).tolist())
+
+    # All valid border cells seed the queue at once
+    border = np.zeros((rows, cols), dtype=bool)
+    border[0, :] = border[-1, :] = border[:, 0] = border[:, -1] = True
+    border &= ~closed_set
+    closed_set |= border
+    seeds = np.flatnonzero(border)
+    seed_z = filled_dem.ravel()[seeds]
+
+    # Integer elevations only ever pop at a non-decreasing level, so a bucket
+    # queue indexed by elevation replaces the heap.
+    if integer_dem:
+        valid = filled_dem[~np.isnan(filled_dem)]
+        open_pq = MonotoneBucketQueue(
+            int(valid.min()) if valid.size else 0,
+            int(valid.max()) if valid.size else -1,
+        )
+        for z, idx in zip(seed_z.tolist(), seeds.tolist()):
+            open_pq.push(z, idx)
+    else:
+        open_pq = list(zip(seed_z.tolist(), seeds.tolist()))
+        heapq.heapify(open_pq)
+
+    while True:
+        if pits:
+            z, idx = pits.popleft()
+        elif open_pq:
+            z, idx = open_pq.pop_min() if integer_dem else heapq.heappop(open_pq)
         else:
-            current = heapq.heappop(open_pq)
+            break
 
         # Process neighbors of current cell
-        for dx, dy in neighbors:
-            nx, ny = current[1][0] + dx, current[1][1] + dy
-            if 0 <= nx < rows and 0 <= ny < cols and not closed_set[nx, ny]:
-                neighbor_value = dem[nx, ny]
-
-                closed_set[nx, ny] = True
-                if neighbor_value <= current[0]:
-                    # If neighbor is lower, add to pits
-                    filled_dem[nx, ny] = current[0]
-                    pits.put((neighbor_value, (nx, ny)))
+        i, j = divmod(idx, cols)
+        for di, dj in _D8_OFFSETS:
+            ni, nj = i + di, j + dj
+            if 0 <= ni < rows and 0 <= nj < cols and not closed_set[ni, nj]:
+                closed_set[ni, nj] = True
+                nz = filled_dem[ni, nj]
+                if nz <= z:
+                    # Neighbor is in a depression: raise it to the spill level
+                    filled_dem[ni, nj] = z
+                    pits.append((z, ni * cols + nj))
+                elif integer_dem:
+                    open_pq.push(nz, ni * cols + nj)
                 else:
-                    # Otherwise, add to open set
-                    heapq.heappush(open_pq, (neighbor_value, (nx, ny)))
+                    heapq.heappush(open_pq, (nz, ni * cols + nj))
+
+    return filled_dem
+
+
+@njit(cache=True)
+def _heap_push(keys, values, size, key, value):
+    """Push onto the binary min-heap stored in `keys`/`values`; return the new size."""
+    pos = size
+    while pos > 0:
+        parent = (pos - 1) >> 1
+        if keys[parent] <= key:
+            break
+        keys[pos] = keys[parent]
+        values[pos] = values[parent]
+        pos = parent
+    keys[pos] = key
+    values[pos] = value
+    return size + 1
+
+
+@njit(cache=True)
+def _heap_pop(keys, values, size):
+    """Pop the minimum of the binary heap; return (key, value, new size)."""
+    key = keys[0]
+    value = values[0]
+    size -= 1
+    last_key = keys[size]
+    last_value = values[size]
+    pos = 0
+    while True:
+        child = 2 * pos + 1
+        if child >= size:
+            break
+        if child + 1 < size and keys[child + 1] < keys[child]:
+            child += 1
+        if last_key <= keys[child]:
+            break
+        keys[pos] = keys[child]
+        values[pos] = values[child]
+        pos = child
+    keys[pos] = last_key
+    values[pos] = last_value
+    return key, value, size
+
+
+@njit(cache=True)
+def _priority_flood(dem_flat, rows, cols):
+    """
+    Priority-Flood over a row-major flattened DEM, filling it in place.
+
+    Cells are addressed by their flat index ``i * cols + j``. The open set is a
+    binary heap of (elevation, index) pairs in two preallocated arrays and the pits
+    are a FIFO buffer of indices; every cell enters one of them at most once, so
+    neither needs to grow. NaN (nodata) cells start in the pit buffer, which makes
+    their neighbours outlets just like the raster border.
+    """
+    n = rows * cols
+    heap_keys = np.empty(n, dtype=dem_flat.dtype)
+    heap_idx = np.empty(n, dtype=np.int32)
+    heap_size = 0
+    pits = np.empty(n, dtype=np.int32)
+    head = 0
+    tail = 0
+    closed = np.zeros(n, dtype=np.uint8)
+
+    for idx in range(n):
+        if np.isnan(dem_flat[idx]):
+            closed[idx] = 1
+            pits[tail] = idx
+            tail += 1
+
+    # Seed the heap with the border cells
+    for i in range(rows):
+        for j in (0, cols - 1):
+            idx = i * cols + j
+            if not closed[idx]:
+                closed[idx] = 1
+                heap_size = _heap_push(
+                    heap_keys, heap_idx, heap_size, dem_flat[idx], idx
+                )
+    for j in range(1, cols - 1):
+        for i in (0, rows - 1):
+            idx = i * cols + j
+            if not closed[idx]:
+                closed[idx] = 1
+                heap_size = _heap_push(
+                    heap_keys, heap_idx, heap_size, dem_flat[idx], idx
+                )
+
+    while head < tail or heap_size > 0:
+        if head < tail:
+            idx = pits[head]
+            head += 1
+        else:
+            _, idx, heap_size = _heap_pop(heap_keys, heap_idx, heap_size)
+        # Pits have already been raised, so this is the current spill level. It
+        # is NaN for nodata cells, which never raises a neighbour.
+        z = dem_flat[idx]
+        i = idx // cols
+        j = idx - i * cols
+        for k in range(8):
+            ni = i + _D8_DI[k]
+            nj = j + _D8_DJ[k]
+            if ni < 0 or ni >= rows or nj < 0 or nj >= cols:
+                continue
+            nidx = ni * cols + nj
+            if closed[nidx]:
+                continue
+            closed[nidx] = 1
+            if dem_flat[nidx] <= z:
+                dem_flat[nidx] = z
+                pits[tail] = nidx
+                tail += 1
+            else:
+                heap_size = _heap_push(
+                    heap_keys, heap_idx, heap_size, dem_flat[nidx], nidx
+                )
+    return dem_flat
+
+
+@njit(cache=True)
+def _priority_flood_buckets(dem_flat, rows, cols, min_z, n_levels):
+    """
+    Priority-Flood over a flattened DEM holding integer elevations, in place.
+
+    Same as `_priority_flood`, but the open set is a monotone bucket queue: one
+    LIFO list per elevation level from `min_z`, threaded through a `next` array
+    indexed by cell. Pops never go below the current level, so a single cursor
+    sweeps the levels once and every queue operation is O(1).
+    """
+    n = rows * cols
+    bucket_head = np.full(n_levels, -1, dtype=np.int32)
+    bucket_next = np.empty(n, dtype=np.int32)
+    level = 0
+    pits = np.empty(n, dtype=np.int32)
+    head = 0
+    tail = 0
+    closed = np.zeros(n, dtype=np.uint8)
+
+    for idx in range(n):
+        if np.isnan(dem_flat[idx]):
+            closed[idx] = 1
+            pits[tail] = idx
+            tail += 1
+
+    # Seed the buckets with the border cells
+    for idx in range(n):
+        i = idx // cols
+        j = idx - i * cols
+        if closed[idx] or not (i == 0 or i == rows - 1 or j == 0 or j == cols - 1):
+            continue
+        closed[idx] = 1
+        b = int(dem_flat[idx]) - min_z
+        bucket_next[idx] = bucket_head[b]
+        bucket_head[b] = idx
+
+    while True:
+        if head < tail:
+            idx = pits[head]
+            head += 1
+        else:
+            while level < n_levels and bucket_head[level] < 0:
+                level += 1
+            if level == n_levels:
+                break
+            idx = bucket_head[level]
+            bucket_head[level] = bucket_next[idx]
+        z = dem_flat[idx]
+        i = idx // cols
+        j = idx - i * cols
+        for k in range(8):
+            ni = i + _D8_DI[k]
+            nj = j + _D8_DJ[k]
+            if ni < 0 or ni >= rows or nj < 0 or nj >= cols:
+                continue
+            nidx = ni * cols + nj
+            if closed[nidx]:
+                continue
+            closed[nidx] = 1
+            if dem_flat[nidx] <= z:
+                dem_flat[nidx] = z
+                pits[tail] = nidx
+                tail += 1
+            else:
+                b = int(dem_flat[nidx]) - min_z
+                bucket_next[nidx] = bucket_head[b]
+                bucket_head[b] = nidx
+    return dem_flat
+
+
+@njit(nogil=True, cache=True)
+def _flood_tile(dem_flat, rows, cols, labels, outer):
+    """
+    Priority-Flood one tile in place, treating its whole perimeter as outlets.
+
+    Every cell is labelled with the perimeter seed it was flooded from. Seeds on
+    the DEM edge (``outer`` flags the top, bottom, left and right sides) and NaN
+    cells get label 0, the "ocean"; the other perimeter cells get labels 1..n.
+    Wherever two labels meet, the lowest elevation at which water can pass
+    between them is recorded.
 
+    Returns:
+        tuple: (number of labels including 0, edge keys ``a * n_labels + b`` with
+            ``a < b``, edge spill elevations)
+    """
+    n = rows * cols
+    heap_keys = np.empty(n, dtype=dem_flat.dtype)
+    heap_idx = np.empty(n, dtype=np.int32)
+    heap_size = 0
+    pits = np.empty(n, dtype=np.int32)
+    head = 0
+    tail = 0
+    closed = np.zeros(n, dtype=np.uint8)
+
+    for idx in range(n):
+        labels[idx] = 0
+        if np.isnan(dem_flat[idx]):
+            closed[idx] = 1
+            pits[tail] = idx
+            tail += 1
+
+    n_labels = 1
+    for idx in range(n):
+        if closed[idx]:
+            continue
+        i = idx // cols
+        j = idx - i * cols
+        top, bottom = i == 0, i == rows - 1
+        left, right = j == 0, j == cols - 1
+        if not (top or bottom or left or right):
+            continue
+        closed[idx] = 1
+        on_edge = (
+            (top and outer[0])
+            or (bottom and outer[1])
+            or (left and outer[2])
+            or (right and outer[3])
+        )
+        if not on_edge:
+            labels[idx] = n_labels
+            n_labels += 1
+        heap_size = _heap_push(heap_keys, heap_idx, heap_size, dem_flat[idx], idx)
+
+    spill = dict()
+    while head < tail or heap_size > 0:
+        if head < tail:
+            idx = pits[head]
+            head += 1
+        else:
+            _, idx, heap_size = _heap_pop(heap_keys, heap_idx, heap_size)
+        z = dem_flat[idx]
+        label = labels[idx]
+        i = idx // cols
+        j = idx - i * cols
+        for k in range(8):
+            ni = i + _D8_DI[k]
+            nj = j + _D8_DJ[k]
+            if ni < 0 or ni >= rows or nj < 0 or nj >= cols:
+                continue
+            nidx = ni * cols + nj
+            if closed[nidx]:
+                other = labels[nidx]
+                if other != label:
+                    nz = dem_flat[nidx]
+                    w = nz if np.isnan(z) or nz > z else z
+                    a, b = min(label, other), max(label, other)
+                    key = np.int64(a) * n_labels + b
+                    if key not in spill or w < spill[key]:
+                        spill[key] = w
+                continue
+            closed[nidx] = 1
+            labels[nidx] = label
+            if dem_flat[nidx] <= z:
+                dem_flat[nidx] = z
+                pits[tail] = nidx
+                tail += 1
+            else:
+                heap_size = _heap_push(
+                    heap_keys, heap_idx, heap_size, dem_flat[nidx], nidx
+                )
+
+    edge_keys = np.empty(len(spill), dtype=np.int64)
+    edge_spill = np.empty(len(spill), dtype=dem_flat.dtype)
+    m = 0
+    for key, w in spill.items():
+        edge_keys[m] = key
+        edge_spill[m] = w
+        m += 1
+    return n_labels, edge_keys, edge_spill
+
+
+@njit(cache=True)
+def _spill_elevations(indptr, neighbours, weights, n_labels):
+    """
+    Lowest elevation each label must be raised to for water to reach the ocean.
+
+    A minimax Dijkstra from label 0 over the label graph in CSR form.
+    """
+    spill = np.full(n_labels, np.inf, dtype=weights.dtype)
+    spill[0] = -np.inf
+    done = np.zeros(n_labels, dtype=np.uint8)
+    heap_keys = np.empty(len(neighbours) + 1, dtype=weights.dtype)
+    heap_idx = np.empty(len(neighbours) + 1, dtype=np.int32)
+    heap_size = _heap_push(heap_keys, heap_idx, 0, spill[0], 0)
+    while heap_size > 0:
+        z, u, heap_size = _heap_pop(heap_keys, heap_idx, heap_size)
+        if done[u]:
+            continue
+        done[u] = 1
+        for e in range(indptr[u], indptr[u + 1]):
+            v = neighbours[e]
+            w = max(z, weights[e])
+            if w < spill[v]:
+                spill[v] = w
+                heap_size = _heap_push(heap_keys, heap_idx, heap_size, w, v)
+    return spill
+
+
+def _seam_edges(labels, elev, axis, index):
+    """Label pairs and spill elevations across the seam after `index` on `axis`."""
+    if axis == 1:
+        labels, elev = labels.T, elev.T
+    a_labels, b_labels = labels[index], labels[index + 1]
+    a_elev, b_elev = elev[index], elev[index + 1]
+    # Straight across, then both diagonals
+    pairs = [
+        (slice(None), slice(None)),
+        (slice(None, -1), slice(1, None)),
+        (slice(1, None), slice(None, -1)),
+    ]
+    edges = []
+    for a, b in pairs:
+        la, lb = a_labels[a], b_labels[b]
+        keep = la != lb
+        w = np.fmax(a_elev[a], b_elev[b])
+        edges.append((la[keep], lb[keep], w[keep]))
+    return edges
+
+
+def _flood_tile_into(elev, labels, tile_bounds):
+    """
+    Flood one tile of `elev` in place and write its local labels into `labels`.
+
+    Returns:
+        tuple: The result of `_flood_tile` for the tile.
+    """
+    rows, cols = elev.shape
+    i0, i1, j0, j1 = tile_bounds
+    tile = np.ascontiguousarray(elev[i0:i1, j0:j1])
+    tile_labels = np.empty(tile.shape, dtype=np.int32)
+    outer = np.array([i0 == 0, i1 == rows, j0 == 0, j1 == cols])
+    result = _flood_tile(tile.ravel(), i1 - i0, j1 - j0, tile_labels.ravel(), outer)
+    elev[i0:i1, j0:j1] = tile
+    labels[i0:i1, j0:j1] = tile_labels
+    return result
+
+
+def _flood_shared_tile(elev_name, labels_name, shape, tile_bounds):
+    """Process pool worker: `_flood_tile_into` on arrays held in shared memory."""
+    elev_shm = shared_memory.SharedMemory(name=elev_name)
+    labels_shm = shared_memory.SharedMemory(name=labels_name)
+    try:
+        elev = np.ndarray(shape, dtype=np.float32, buffer=elev_shm.buf)
+        labels = np.ndarray(shape, dtype=np.int32, buffer=labels_shm.buf)
+        result = _flood_tile_into(elev, labels, tile_bounds)
+        # The views must be released before the shared memory can be closed
+        del elev, labels
+        return result
+    finally:
+        elev_shm.close()
+        labels_shm.close()
+
+
+def _fill_tiled(elev, labels, tile_size, flood_tiles):
+    """
+    Fill a float32 DEM with NaN nodata in place, one tile at a time.
+
+    The three steps of the parallel Priority-Flood (Barnes, 2016): flood every
+    tile with its perimeter as outlets, solve the small graph of labels formed by
+    the tile perimeters for the spill elevation of each label, then raise every
+    cell to the spill elevation of its label.
+
+    Args:
+        elev (numpy.ndarray): C-contiguous float32 DEM, modified in place.
+        labels (numpy.ndarray): int32 array of the same shape, used as scratch.
+        tile_size (int): Side length of the tiles in cells.
+        flood_tiles (callable): Takes a list of ``(i0, i1, j0, j1)`` tile bounds,
+            runs `_flood_tile_into` on `elev` and `labels` for each of them and
+            returns the results in the same order, e.g. through an executor.
+    """
+    if elev.size == 0:
+        return elev
+    rows, cols = elev.shape
+    row_starts = list(range(0, rows, tile_size))
+    col_starts = list(range(0, cols, tile_size))
+    bounds = [
+        (i0, min(i0 + tile_size, rows), j0, min(j0 + tile_size, cols))
+        for i0 in row_starts
+        for j0 in col_starts
+    ]
+
+    sources, targets, weights = [], [], []
+    offset = 0
+    for (i0, i1, j0, j1), result in zip(bounds, flood_tiles(bounds)):
+        n_labels, edge_keys, edge_spill = result
+        # Local labels 1..n-1 become offset+1..offset+n-1; 0 is shared
+        to_global = np.arange(n_labels, dtype=np.int32) + offset
+        to_global[0] = 0
+        labels[i0:i1, j0:j1] = to_global[labels[i0:i1, j0:j1]]
+        sources.append(to_global[edge_keys // n_labels])
+        targets.append(to_global[edge_keys % n_labels])
+        weights.append(edge_spill)
+        offset += n_labels - 1
+
+    for axis, starts in ((0, row_starts), (1, col_starts)):
+        for start in starts[1:]:
+            for a, b, w in _seam_edges(labels, elev, axis, start - 1):
+                sources.append(a)
+                targets.append(b)
+                weights.append(w)
+
+    # Undirected label graph in CSR form
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    weights = np.concatenate(weights).astype(elev.dtype)
+    order = np.argsort(np.concatenate([sources, targets]), kind="stable")
+    neighbours = np.concatenate([targets, sources])[order]
+    weights = np.concatenate([weights, weights])[order]
+    counts = np.bincount(np.concatenate([sources, targets]), minlength=offset + 1)
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+
+    spill = _spill_elevations(indptr, neighbours, weights, offset + 1)
+    np.maximum(elev, spill[labels], out=elev)
+
+
+def fill_depressions_parallel(dem, nodata_value=np.nan, tile_size=1024, n_workers=None):
+    """
+    Fill depressions in a DEM with the tiled Priority-Flood on a process pool.
+
+    Like `fill_depressions` with `tile_size`, but the tiles are flooded in worker
+    processes. The DEM and the label scratch array live in shared memory, so the
+    workers read and write them directly and only the small per-tile label graphs
+    are sent back to the main process.
+
+    The workers are always started with the "spawn" method, even on Linux, so a
+    script that calls this function must do so under an
+    ``if __name__ == "__main__":`` guard.
+
+    Args:
+        dem (numpy.ndarray): 2D array of elevations.
+        nodata_value (float): Value marking nodata cells. NaN cells are always
+            treated as nodata.
+        tile_size (int): Side length of the tiles in cells. Default is 1024.
+        n_workers (int | None): Number of worker processes. Defaults to the
+            number of CPUs.
+
+    Returns:
+        filled_dem (numpy.ndarray): float32 copy of `dem` with all depressions
+            filled. Nodata cells keep `nodata_value`.
+    """
+    elev = _as_float32_dem(dem, nodata_value)
+    if elev.size == 0:
+        return elev.copy()
+    size = elev.size * 4
+    elev_shm = shared_memory.SharedMemory(create=True, size=size)
+    labels_shm = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        shared_elev = np.ndarray(elev.shape, dtype=np.float32, buffer=elev_shm.buf)
+        labels = np.ndarray(elev.shape, dtype=np.int32, buffer=labels_shm.buf)
+        shared_elev[...] = elev
+        flood = partial(_flood_shared_tile, elev_shm.name, labels_shm.name, elev.shape)
+        # Workers are spawned: forking a parent that already runs numba's
+        # threading layer can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+            _fill_tiled(
+                shared_elev,
+                labels,
+                tile_size,
+                lambda bounds: executor.map(flood, bounds),
+            )
+        filled_dem = shared_elev.copy()
+        del shared_elev, labels
+    finally:
+        elev_shm.close()
+        elev_shm.unlink()
+        labels_shm.close()
+        labels_shm.unlink()
+
+    if not np.isnan(nodata_value):
+        filled_dem[np.isnan(filled_dem)] = nodata_value
     return filled_dem
 
 
+@dataclass
+class DEMArrays:
+    """
+    Contiguous buffers shared by the DEM processing steps.
+
+    Elevations are float32 with NaN marking nodata, and flow directions are int32,
+    so the D8 and depression filling kernels can work on the same buffers without
+    converting or copying them between steps.
+
+    Attributes:
+        elev (numpy.ndarray): float32 elevations.
+        flow_dir (numpy.ndarray): int32 D8 direction codes of `filled`.
+        filled (numpy.ndarray): float32 depression-filled elevations.
+    """
+
+    elev: np.ndarray
+    flow_dir: np.ndarray
+    filled: np.ndarray
+
+    @classmethod
+    def from_dem(cls, dem, nodata_value=np.nan):
+        """
+        Allocate the buffers for a DEM.
+
+        Args:
+            dem (numpy.ndarray): 2D array of elevations.
+            nodata_value (float): Value marking nodata cells.
+
+        Returns:
+            DEMArrays: Buffers with `filled` initialised to the elevations and
+                `flow_dir` to -1.
+        """
+        elev = _as_float32_dem(dem, nodata_value)
+        return cls(
+            elev=elev,
+            flow_dir=np.full(elev.shape, -1, dtype=np.int32),
+            filled=elev.copy(),
+        )
+
+    def fill_depressions(self):
+        """Fill the depressions of `elev` into `filled` and return it."""
+        np.copyto(self.filled, self.elev)
+        _fill_float32(self.filled)
+        return self.filled
+
+    def compute_d8_direction(self):
+        """Compute the D8 directions of `filled` into `flow_dir` and return it."""
+        _d8_float32(self.filled, self.flow_dir)
+        return self.flow_dir
+
+
+def quantize_dem(dem, precision=0.01, nodata_value=np.nan):
+    """
+    Quantize a DEM to integer steps of `precision` above its lowest cell.
+
+    Integer DEMs are filled with a bucket queue (see `fill_depressions`), so
+    quantizing a float DEM first makes its fill linear in the number of cells.
+    Elevations are rounded, so each cell moves by at most `precision / 2`.
+
+    Args:
+        dem (numpy.ndarray): 2D array of elevations.
+        precision (float): Size of one quantization step, in elevation units.
+            Default is 0.01 (cm for a DEM in meters).
+        nodata_value (float): Value marking nodata cells. NaN cells are always
+            treated as nodata.
+
+    Returns:
+        levels (numpy.ndarray): int16 array of steps above `offset`, or int32 if
+            the elevation range needs more than 32767 steps. Nodata cells are -1.
+        offset (float): Elevation of level 0.
+    """
+    elev = np.asarray(dem, dtype=np.float64)
+    nodata = np.isnan(elev)
+    if not np.isnan(nodata_value):
+        nodata |= elev == nodata_value
+    valid = elev[~nodata]
+    offset = float(np.floor(valid.min() / precision) * precision) if valid.size else 0.0
+    steps = np.rint((elev - offset) / precision)
+    steps[nodata] = -1
+    max_level = steps.max() if steps.size else 0
+    dtype = np.int16 if max_level <= np.iinfo(np.int16).max else np.int32
+    if max_level > np.iinfo(np.int32).max:
+        raise ValueError(f"Precision {precision} is too fine for this DEM")
+    return steps.astype(dtype), offset
+
+
+def dequantize_dem(levels, offset, precision=0.01, nodata_value=np.nan):
+    """
+    Convert levels from `quantize_dem` back to elevations.
+
+    Args:
+        levels (numpy.ndarray): Array of quantization steps, with -1 for nodata.
+        offset (float): Elevation of level 0, as returned by `quantize_dem`.
+        precision (float): Size of one quantization step. Default is 0.01.
+        nodata_value (float): Value written to nodata cells. Default is NaN.
+
+    Returns:
+        dem (numpy.ndarray): float64 array of elevations.
+    """
+    levels = np.asarray(levels)
+    # float32 levels (as returned by `fill_depressions`) are widened first, so
+    # the elevations are not rounded to float32
+    dem = levels.astype(np.float64) * precision + offset
+    dem[levels < 0] = nodata_value
+    return dem
+
+
+def resolve_flats(dem, max_rise, nodata_value=np.nan):
+    """
+    Add a small gradient across flats so that every cell has a downslope neighbour.
+
+    A filled DEM is perfectly flat over every filled depression, which leaves D8
+    with no receiver there. Each cell on a flat is raised in proportion to its
+    distance, in cells, from the nearest exit of the flat: a flat cell with a lower
+    or nodata neighbour, or on the raster border. Flow then runs across the flat
+    towards its outlet.
+
+    Args:
+        dem (numpy.ndarray): 2D array of depressionless elevations.
+        max_rise (float): Upper bound on how much any cell is raised. Keep it below
+            the smallest real elevation difference (e.g. half the quantization
+            step) so no new depressions or drops are created.
+        nodata_value (float): Value marking nodata cells. NaN cells are always
+            treated as nodata.
+
+    Returns:
+        dem (numpy.ndarray): float64 copy of `dem` with the flats tilted. Nodata
+            cells keep `nodata_value`.
+    """
+    elev = np.array(dem, dtype=np.float64)
+    nodata = np.isnan(elev)
+    if not np.isnan(nodata_value):
+        nodata |= elev == nodata_value
+    elev[nodata] = np.nan
+    rows, cols = elev.shape
+    dist = _flat_distances(elev.ravel(), rows, cols).reshape(elev.shape)
+    if dist.size and dist.max() > 0:
+        elev += dist * (max_rise / (dist.max() + 1))
+    elev[nodata] = nodata_value
+    return elev
+
+
+@njit(cache=True)
+def _flat_distances(dem_flat, rows, cols):
+    """
+    Breadth-first distance from every cell to the nearest exit of its flat.
+
+    Exits (and cells that are not on a flat) get 0. The search only moves between
+    neighbours of equal elevation, using a preallocated FIFO of flat indices.
+    """
+    n = rows * cols
+    dist = np.full(n, -1, dtype=np.int64)
+    queue = np.empty(n, dtype=np.int64)
+    head = 0
+    tail = 0
+    for idx in range(n):
+        z = dem_flat[idx]
+        if np.isnan(z):
+            dist[idx] = 0
+            continue
+        i = idx // cols
+        j = idx - i * cols
+        if i == 0 or i == rows - 1 or j == 0 or j == cols - 1:
+            dist[idx] = 0
+        else:
+            for k in range(8):
+                nz = dem_flat[(i + _D8_DI[k]) * cols + j + _D8_DJ[k]]
+                if np.isnan(nz) or nz < z:
+                    dist[idx] = 0
+                    break
+        if dist[idx] == 0:
+            queue[tail] = idx
+            tail += 1
+
+    while head < tail:
+        idx = queue[head]
+        head += 1
+        z = dem_flat[idx]
+        i = idx // cols
+        j = idx - i * cols
+        for k in range(8):
+            ni = i + _D8_DI[k]
+            nj = j + _D8_DJ[k]
+            if ni < 0 or ni >= rows or nj < 0 or nj >= cols:
+                continue
+            nidx = ni * cols + nj
+            if dist[nidx] < 0 and dem_flat[nidx] == z:
+                dist[nidx] = dist[idx] + 1
+                queue[tail] = nidx
+                tail += 1
+
+    # Cells that cannot reach an exit (only possible if `dem` has depressions)
+    for idx in range(n):
+        if dist[idx] < 0:
+            dist[idx] = 0
+    return dist
+
+
 def fill_depression_epsilon(dem, nodata_value=-9999):
     """
     Fill depressions in a DEM using an epsilon-based approach.
     """
-    import heapq
-    import numpy as np
-    import queue
-
     filled_dem = dem.copy()
     rows, cols = dem.shape
     open_pq = []
-    pits = queue.Queue()
+    pits = deque()
     closed_set = np.zeros((rows, cols), dtype=bool)
 
-    neighbors = [
-        (-1, 0),  # North
-        (1, 0),  # South
-        (0, -1),  # West
-        (0, 1),  # East
-        (-1, -1),  # Northwest
-        (-1, 1),  # Northeast
-        (1, -1),  # Southwest
-        (1, 1),  # Southeast
-    ]
-
     # Initialize the priority queue with border cells
     for i in range(rows):
         heapq.heappush(open_pq, (dem[i, 0], (i, 0)))
@@ -146,14 +1081,14 @@ def fill_depression_epsilon(dem, nodata_value=-9999):
 
     pit_top = None
     false_pit_cells = 0
-    while open_pq or not pits.empty():
+    while open_pq or pits:
         current = None
 
         if open_pq and (open_pq[0][0] == pit_top):
             current = heapq.heappop(open_pq)
             pit_top = None
-        elif not pits.empty():
-            current = pits.get()
+        elif pits:
+            current = pits.popleft()
             if pit_top is None:
                 pit_top = dem[current[1][0], current[1][1]]
         else:
@@ -161,14 +1096,14 @@ def fill_depression_epsilon(dem, nodata_value=-9999):
             pit_top = None
 
         # Process neighbors of current cell
-        for dx, dy in neighbors:
+        for dx, dy in _D8_OFFSETS:
             nx, ny = current[1][0] + dx, current[1][1] + dy
             if 0 <= nx < rows and 0 <= ny < cols and not closed_set[nx, ny]:
                 neighbor_value = dem[nx, ny]
 
                 closed_set[nx, ny] = True
                 if neighbor_value == nodata_value or np.isnan(neighbor_value):
-                    pits.put((neighbor_value, (nx, ny)))
+                    pits.append((neighbor_value, (nx, ny)))
                 elif neighbor_value <= np.nextafter(current[0], np.float64("inf")):
                     next_after_value = np.nextafter(current[0], np.float64("inf"))
                     if pit_top is not None and (
@@ -176,7 +1111,7 @@ def fill_depression_epsilon(dem, nodata_value=-9999):
                     ):
                         false_pit_cells += 1
                     filled_dem[nx, ny] = next_after_value
-                    pits.put((neighbor_value, (nx, ny)))
+                    pits.append((neighbor_value, (nx, ny)))
                 else:
                     # Otherwise, add to open set
                     heapq.heappush(open_pq, (neighbor_value, (nx, ny)))
@@ -186,76 +1121,55 @@ def fill_depression_epsilon(dem, nodata_value=-9999):
 
 def fill_depressions_flow_dirs(dem):
     """
-    Fill depressions in a DEM using a simple algorithm.
-    """
-    import heapq
-    import numpy as np
-    import queue
+    Compute D8 flow directions that route across depressions, using Priority-Flood.
 
-    def get_opposite_direction(x, y):
-        """Get the opposite direction for a given D8 direction."""
-        return [-x, -y]
+    Cells are reached from the raster border in order of elevation and each one
+    flows towards the cell it was reached from, so flow leaves every depression
+    over its lowest outlet without modifying the DEM. Border cells flow off the
+    raster, and nodata cells are outlets just like the border.
+
+    Args:
+        dem (numpy.ndarray): 2D array of elevations, with NaN for nodata.
 
+    Returns:
+        flow_dirs (numpy.ndarray): int32 array of D8 direction codes. Nodata cells
+            are set to -1.
+    """
     rows, cols = dem.shape
     open_pq = []
     closed_set = np.zeros((rows, cols), dtype=bool)
     flow_dirs = np.zeros_like(dem, dtype=np.int32)
+    nodata = np.isnan(dem)
 
-    direction_code = {
-        (-1, 0): 64,  # 1: North
-        (0, 1): 1,  # 3: East
-        (0, 1): 4,  # 5: South
-        (0, -1): 16,  # 7: West
-        (-1, -1): 32,  # 0: North-West
-        (-1, 1): 128,  # 2: North-East
-        (1, 1): 2,  # 4: South-East
-        (1, -1): 8,  # 6: South-West
-    }
+    def visit(i, j, code):
+        closed_set[i, j] = True
+        flow_dirs[i, j] = -1 if nodata[i, j] else code
+        heapq.heappush(open_pq, (-np.inf if nodata[i, j] else dem[i, j], (i, j)))
 
-    # Initialize the priority queue with border cells
+    # Nodata cells drain freely, like the raster border, so they are seeded as
+    # -inf outlets before anything else
+    for i, j in zip(*np.nonzero(nodata)):
+        visit(i, j, -1)
+
+    # Initialize the priority queue with border cells, pointing off the raster
     for i in range(rows):
-        heapq.heappush(open_pq, (dem[i, 0], (i, 0)))
-        heapq.heappush(open_pq, (dem[i, cols - 1], (i, cols - 1)))
-        closed_set[i, 0] = True
-        if np.isnan(dem[i, 0]):
-            flow_dirs[i, 0] = None
-        else:
-            flow_dirs[i, 0] = 1
-        closed_set[i, cols - 1] = True
-        if np.isnan(dem[i, cols - 1]):
-            flow_dirs[i, cols - 1] = None
-        else:
-            flow_dirs[i, cols - 1] = 16
+        for j, code in ((0, 16), (cols - 1, 1)):
+            if not closed_set[i, j]:
+                visit(i, j, code)
 
     for j in range(1, cols - 1):
-        heapq.heappush(open_pq, (dem[0, j], (0, j)))
-        heapq.heappush(open_pq, (dem[rows - 1, j], (rows - 1, j)))
-        closed_set[0, j] = True
-        if np.isnan(dem[0, j]):
-            flow_dirs[0, j] = None
-        else:
-            flow_dirs[0, j] = 64
-        closed_set[rows - 1, j] = True
-        if np.isnan(dem[rows - 1, j]):
-            flow_dirs[rows - 1, j] = None
-        else:
-            flow_dirs[rows - 1, j] = 4
+        for i, code in ((0, 64), (rows - 1, 4)):
+            if not closed_set[i, j]:
+                visit(i, j, code)
 
     while open_pq:
-        current = heapq.heappop(open_pq)
+        _, (i, j) = heapq.heappop(open_pq)
 
-        # Process neighbors of current cell
-        for (dx, dy), direction in direction_code.items():
-            nx, ny = current[1][0] + dx, current[1][1] + dy
-            if 0 <= nx < rows and 0 <= ny < cols and not closed_set[nx, ny]:
-                neighbor_value = dem[nx, ny]
-                if np.isnan(neighbor_value):
-                    flow_dirs[nx, ny] = None
-                else:
-                    ox, oy = get_opposite_direction(nx, ny)
-                    flow_dirs[nx, ny] = direction[(ox, oy)]
-                closed_set[nx, ny] = True
-                heapq.heappush(open_pq, (neighbor_value, (nx, ny)))
+        # Process neighbors of current cell; each flows back towards it
+        for k, (di, dj) in enumerate(_D8_OFFSETS):
+            ni, nj = i + di, j + dj
+            if 0 <= ni < rows and 0 <= nj < cols and not closed_set[ni, nj]:
+                visit(ni, nj, int(_D8_CODE[(k + 4) % 8]))
 
     return flow_dirs
 
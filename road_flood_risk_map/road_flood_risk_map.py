@@ -2,14 +2,199 @@
 
 import geemap
 import ee
+import math
 import os
-from whitebox_workflows import WbEnvironment
+import shutil
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import ClassVar, Literal
+from whitebox_workflows import Raster, WbEnvironment
 from IPython.display import display, HTML
 
 
+# The reduced collections only depend on their filter arguments, so they are
+# cached and only the per-call `.clip(region)` is added to the graph.
+@lru_cache(maxsize=8)
+def _alos_palsar_mean(start_date: str = "2017-01-01", end_date: str = "2018-01-01"):
+    """Mean ALOS PALSAR HH image for a date range."""
+    return (
+        ee.ImageCollection("JAXA/ALOS/PALSAR/YEARLY/SAR_EPOCH")
+        .filter(ee.Filter.date(start_date, end_date))
+        .select("HH")
+        .mean()
+    )
+
+
+@lru_cache(maxsize=8)
+def _sentinel_1_mean(
+    scale: int, start_date: str = "2024-06-01", end_date: str = "2025-06-01"
+):
+    """Mean Sentinel-1 VH image for a resolution and date range."""
+    return (
+        ee.ImageCollection("COPERNICUS/S1_GRD")
+        .filter(ee.Filter.listContains("transmitterReceiverPolarisation", "VH"))
+        .filter(ee.Filter.date(start_date, end_date))
+        .filter(ee.Filter.eq("resolution_meters", scale))
+        .select("VH")
+        .mean()
+    )
+
+
+# Earth Engine rejects getDownloadURL requests over 32 MB or 10000 pixels a side.
+# Tiles are sized to 90% of the byte limit to leave room for the GeoTIFF headers.
+_EE_DOWNLOAD_LIMIT_BYTES = 32 * 1024 * 1024
+_EE_DOWNLOAD_MAX_DIM = 10000
+_METERS_PER_DEGREE = 111_320
+
+
+def _tile_deg(
+    scale: float,
+    bytes_per_pixel: int = 8,
+    limit_bytes: int = _EE_DOWNLOAD_LIMIT_BYTES,
+) -> float:
+    """
+    Side length in degrees of the largest square tile that downloads in one request.
+
+    A degree is taken as `_METERS_PER_DEGREE` in both directions. A degree of
+    longitude is never longer than that, so tiles only err on the small side.
+
+    Args:
+        scale (float): The scale in meters at which the image is exported.
+        bytes_per_pixel (int): Bytes per pixel over all bands. Default is 8, a single
+            float64 band, which is what `mean()` composites are.
+        limit_bytes (int): The per-request size limit. Default is 32 MB.
+
+    Returns:
+        float: The tile side length in degrees.
+    """
+    side_px = math.isqrt(int(limit_bytes * 0.9) // bytes_per_pixel)
+    side_px = max(1, min(side_px, _EE_DOWNLOAD_MAX_DIM))
+    return side_px * scale / _METERS_PER_DEGREE
+
+
+def _tile_grid(
+    bounds: tuple[float, float, float, float], tile_deg: float
+) -> list[tuple[float, float, float, float]]:
+    """
+    Split bounds into a row-major grid of tiles at most `tile_deg` on a side.
+
+    Args:
+        bounds (tuple): The (west, south, east, north) bounds in degrees.
+        tile_deg (float): The maximum tile side length in degrees.
+
+    Returns:
+        list: The (west, south, east, north) bounds of each tile.
+    """
+    west, south, east, north = bounds
+    # The tolerance stops rounding error from adding a sliver row or column
+    n_cols = max(1, math.ceil((east - west) / tile_deg - 1e-9))
+    n_rows = max(1, math.ceil((north - south) / tile_deg - 1e-9))
+    return [
+        (
+            west + c * tile_deg,
+            south + r * tile_deg,
+            min(west + (c + 1) * tile_deg, east),
+            min(south + (r + 1) * tile_deg, north),
+        )
+        for r in range(n_rows)
+        for c in range(n_cols)
+    ]
+
+
+def _export_tiled(
+    image: ee.Image,
+    bounds: tuple[float, float, float, float],
+    scale: int,
+    output_path: str,
+    tile_deg: float | None = None,
+    max_workers: int = 16,
+):
+    """
+    Export an image as a grid of tiles downloaded concurrently and mosaicked locally.
+
+    Args:
+        image (ee.Image): The image to export.
+        bounds (tuple): The (west, south, east, north) bounds of the region in degrees.
+        scale (int): The scale in meters at which to export the image.
+        output_path (str): The path of the output GeoTIFF file.
+        tile_deg (float | None): The side length of the tiles in degrees. If None,
+            the largest size that fits the download limit at `scale` is used.
+        max_workers (int): The number of tiles downloaded at once. Default is 16.
+    """
+    import rasterio
+    from rasterio.merge import merge
+
+    tiles = _tile_grid(bounds, tile_deg or _tile_deg(scale))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        def download(index_tile):
+            index, tile = index_tile
+            url = image.getDownloadURL(
+                {
+                    "region": ee.Geometry.BBox(*tile),
+                    "scale": scale,
+                    "format": "GEO_TIFF",
+                }
+            )
+            tile_path = os.path.join(tmp_dir, f"tile_{index}.tif")
+            # Stream the response to disk instead of holding the tile in memory
+            with urllib.request.urlopen(url) as response, open(tile_path, "wb") as f:
+                shutil.copyfileobj(response, f)
+            return tile_path
+
+        # Tile downloads are network bound, so threads overlap them despite the GIL
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tile_paths = list(executor.map(download, enumerate(tiles)))
+
+        sources = [rasterio.open(path) for path in tile_paths]
+        try:
+            mosaic, transform = merge(sources)
+            profile = sources[0].profile
+        finally:
+            for src in sources:
+                src.close()
+
+    profile.update(
+        driver="GTiff",
+        height=mosaic.shape[1],
+        width=mosaic.shape[2],
+        transform=transform,
+    )
+    with rasterio.open(output_path, "w", **profile) as dst:
+        dst.write(mosaic)
+
+
 class RoadFloodRiskMap(geemap.Map):
     """A class to represent a road flood risk map."""
 
+    _wbe_singleton: ClassVar[WbEnvironment | None] = None
+
+    @classmethod
+    def _get_wbe(cls) -> WbEnvironment:
+        """
+        Return the WhiteBox environment shared by all maps, creating it on first use.
+
+        Verbosity is a property of the shared environment, so each map sets it
+        from its own `verbose` right before running WhiteBox tools.
+
+        Returns:
+            WbEnvironment: The shared WhiteBox environment.
+        """
+        if cls._wbe_singleton is None:
+            wbe = WbEnvironment()
+            # os.cpu_count() may be None; WhiteBox then keeps its own default
+            cpu_count = os.cpu_count()
+            if cpu_count is not None:
+                wbe.max_procs = cpu_count
+            # Set the working directory to the current directory
+            wbe.working_directory = str(Path.cwd())
+            cls._wbe_singleton = wbe
+        return cls._wbe_singleton
+
     def __init__(
         self,
         basemap="SATELLITE",
@@ -28,7 +213,7 @@ class RoadFloodRiskMap(geemap.Map):
             zoom (int): The initial zoom level of the map. Default is 4.
             height (str): The height of the map in CSS units. Default is "600px".
             add_google_map (bool): Whether to add Google Maps basemap. Default is False.
-            verbose (bool): Whether to print verbose output. Default is False.
+            verbose (bool): Whether WhiteBox tools print verbose output while this map runs an analysis. Default is False.
         """
         geemap.ee_initialize()  # Initialize Earth Engine
         super().__init__(
@@ -38,11 +223,43 @@ class RoadFloodRiskMap(geemap.Map):
             height=height,
             add_google_map=add_google_map,
         )
-        self.wbe = WbEnvironment()
-        self.wbe.verbose = verbose
-        self.wbe.working_directory = (
-            os.getcwd()
-        )  # Set the working directory to the current directory
+        self.verbose = verbose
+        self.wbe = RoadFloodRiskMap._get_wbe()
+
+    def _export_image(
+        self,
+        image: ee.Image,
+        output_file_name: str | None,
+        region_of_interest: ee.Geometry,
+        scale: int,
+    ):
+        """
+        Export an image to a GeoTIFF file. Nothing is exported if `output_file_name` is None or empty. Regions too large for a single download at `scale` (see `_tile_deg`) are downloaded in tiles with `_export_tiled`.
+
+        Args:
+            image (ee.Image): The image to export.
+            output_file_name (str | None): The name of the output file without extension.
+            region_of_interest (ee.Geometry): The region to export.
+            scale (int): The scale in meters at which to export the image.
+        """
+        if not output_file_name:
+            return
+        try:
+            ring = region_of_interest.bounds().coordinates().get(0).getInfo()
+            xs, ys = [p[0] for p in ring], [p[1] for p in ring]
+            bounds = (min(xs), min(ys), max(xs), max(ys))
+            tile_deg = _tile_deg(scale)
+            if len(_tile_grid(bounds, tile_deg)) > 1:
+                _export_tiled(image, bounds, scale, output_file_name + ".tif", tile_deg)
+                return
+            geemap.ee_export_image(
+                image,
+                filename=output_file_name + ".tif",
+                region=region_of_interest,
+                scale=scale,
+            )
+        except Exception as e:
+            print(f"Error exporting image: {e}")
 
     def retrieve_alos_palsar_data_clip(
         self,
@@ -61,25 +278,10 @@ class RoadFloodRiskMap(geemap.Map):
         Returns:
             image: The ALOS PALSAR data clipped to the region of interest.
         """
-        # Placeholder for actual data retrieval logic
-        sarHh = (
-            ee.ImageCollection("JAXA/ALOS/PALSAR/YEARLY/SAR_EPOCH")
-            .filter(ee.Filter.date("2017-01-01", "2018-01-01"))
-            .select("HH")
-        )
+        mean_img = _alos_palsar_mean()
+        self._export_image(mean_img, output_file_name, region_of_interest, scale)
 
-        if output_file_name != None or output_file_name != "":
-            try:
-                geemap.ee_export_image(
-                    sarHh.mean(),
-                    filename=output_file_name + ".tif",
-                    region=region_of_interest,
-                    scale=scale,
-                )
-            except Exception as e:
-                print(f"Error exporting image: {e}")
-
-        return sarHh.mean().clip(region_of_interest)
+        return mean_img.clip(region_of_interest)
 
     def retrieve_sentinel_1_data_clip(
         self,
@@ -98,61 +300,160 @@ class RoadFloodRiskMap(geemap.Map):
         Returns:
             image: The Sentinel-1 data clipped to the region of interest.
         """
-        # Placeholder for actual data retrieval logic
-        sentinel1 = (
-            ee.ImageCollection("COPERNICUS/S1_GRD")
-            .filter(ee.Filter.listContains("transmitterReceiverPolarisation", "VH"))
-            .filter(ee.Filter.date("2024-06-01", "2025-06-01"))
-            .filter(ee.Filter.eq("resolution_meters", scale))
-            .select("VH")
-        )
+        mean_img = _sentinel_1_mean(scale)
+        self._export_image(mean_img, output_file_name, region_of_interest, scale)
 
-        if output_file_name != None and output_file_name != "":
-            try:
-                geemap.ee_export_image(
-                    sentinel1.mean(),
-                    filename=output_file_name + ".tif",
-                    region=region_of_interest,
-                    scale=scale,
-                )
-            except Exception as e:
-                print(f"Error exporting image: {e}")
+        return mean_img.clip(region_of_interest)
+
+    def retrieve_all(
+        self,
+        region_of_interest: ee.Geometry,
+        output_prefix: str | None = None,
+        alos_palsar_scale: int = 30,
+        sentinel_1_scale: int = 10,
+    ):
+        """
+        Retrieve both the ALOS PALSAR and Sentinel-1 data clipped to a region of interest. If `output_prefix` is provided, both images are exported concurrently to `{output_prefix}_alos_palsar.tif` and `{output_prefix}_sentinel_1.tif`.
+
+        Args:
+            region_of_interest (Geometry.BBox): The region to clip the data to. See `retrieve_alos_palsar_data_clip` for the format.
+            output_prefix (str | None): The prefix of the output file names. If None, the data will not be saved to files.
+            alos_palsar_scale (int): The scale in meters at which to export the ALOS PALSAR image. Default is 30.
+            sentinel_1_scale (int): The scale in meters at which to export the Sentinel-1 image. Default is 10.
 
-        return sentinel1.mean().clip(region_of_interest)
+        Returns:
+            alos_palsar_image: The ALOS PALSAR data clipped to the region of interest.
+            sentinel_1_image: The Sentinel-1 data clipped to the region of interest.
+        """
+        alos_file_name = sentinel_file_name = None
+        if output_prefix:
+            alos_file_name = f"{output_prefix}_alos_palsar"
+            sentinel_file_name = f"{output_prefix}_sentinel_1"
+
+        # Exports are network bound, so threads overlap them despite the GIL
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            alos_future = executor.submit(
+                self.retrieve_alos_palsar_data_clip,
+                region_of_interest,
+                output_file_name=alos_file_name,
+                scale=alos_palsar_scale,
+            )
+            sentinel_future = executor.submit(
+                self.retrieve_sentinel_1_data_clip,
+                region_of_interest,
+                output_file_name=sentinel_file_name,
+                scale=sentinel_1_scale,
+            )
+            return alos_future.result(), sentinel_future.result()
 
-    def perform_hydrological_analysis(self, input_dem_file: str):
+    def perform_hydrological_analysis(
+        self,
+        input_dem_file: str,
+        depression_method: Literal[
+            "breach", "fill", "breach_then_fill"
+        ] = "breach_then_fill",
+        precision: float | None = None,
+    ):
         """
         Perform a hydrological analysis on the region of interest. If `output_file_name` is provided, the results will be saved to a file.
 
         Args:
             input_dem_file (str): The path to the input DEM file.
             output_file_name (str): The name of the output file to save the results. If None, the results will not be saved to a file.
+            depression_method (str): How depressions are removed before routing flow. "breach_then_fill" carves least-cost breach paths through them and then fills the depressions that could not be breached, so every depression is resolved. "fill" only fills them. "breach" only breaches them, so depressions that cannot be breached within WhiteBox's default maximum breach distance stay in the DEM and flow accumulation stops at them. Default is "breach_then_fill".
+            precision (float | None): Only used with the "fill" method. If given, the DEM is quantized to integer steps of this size (e.g. 0.01 for cm) and filled with the bucket-queue Priority-Flood in `common` instead of WhiteBox. Filled elevations are then within `precision` of the exact fill, and filled depressions are given a gradient towards their outlet like WhiteBox does. Default is None.
 
         Returns:
             filled_file_name (str): The filled DEM raster file name.
             d8_ptr_file_name (str): The D8 flow pointer raster file name.
             flow_accum_file_name (str): The flow accumulation raster file name.
         """
+        if depression_method not in ("breach", "fill", "breach_then_fill"):
+            raise ValueError(f"Unknown depression method: {depression_method}")
+        if precision is not None and depression_method != "fill":
+            raise ValueError(
+                "precision is only supported with depression_method='fill'"
+            )
+
+        # The environment is shared by all maps, so apply this map's verbosity
+        self.wbe.verbose = self.verbose
+
         # Retrieve DEM data
         dem = self.wbe.read_raster(input_dem_file)
 
-        # Resolves all of the depressions in a DEM, outputting a breached DEM, an aspect-aligned non-divergent flow pointer, and a flow accumulation raster.
+        # The quantized fill is written to a temporary GeoTIFF that WhiteBox reads
+        # lazily, so it has to outlive the analysis and the output writes.
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Breaching and filling are alternatives; running a full fill after a
+            # breach would be a second priority-flood over the whole raster. With
+            # fill_deps, only the depressions left after breaching are filled,
+            # which resolves every depression like flow_accum_full_workflow did.
+            if depression_method == "fill" and precision is not None:
+                filled = self._fill_quantized(dem, precision, tmp_dir)
+            elif depression_method == "fill":
+                filled = self.wbe.fill_depressions(dem=dem)
+            else:
+                filled = self.wbe.breach_depressions_least_cost(
+                    dem=dem, fill_deps=depression_method == "breach_then_fill"
+                )
+            d8_ptr = self.wbe.d8_pointer(dem=filled)
+            flow_accum = self.wbe.d8_flow_accum(
+                input=d8_ptr,
+                out_type="sca",
+                log_transform=True,
+                input_is_pointer=True,
+            )
+            base_file = os.path.basename(input_dem_file)
+            filled_file_name = f"filled_{base_file}"
+            d8_ptr_file_name = f"d8_flow_{base_file}"
+            flow_accum_file_name = f"flow_{base_file}"
+
+            # The three writes are independent and I/O bound, so they overlap
+            outputs = [
+                (filled, filled_file_name),
+                (d8_ptr, d8_ptr_file_name),
+                (flow_accum, flow_accum_file_name),
+            ]
+            with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+                futures = [
+                    executor.submit(self.wbe.write_raster, raster, file_name)
+                    for raster, file_name in outputs
+                ]
+                for future in futures:
+                    future.result()
+
+        return filled_file_name, d8_ptr_file_name, flow_accum_file_name
 
-        filled, d8_ptr, flow_accum = self.wbe.flow_accum_full_workflow(
-            dem=dem,
-            out_type="sca",
-            log_transform=True,
-        )
-        base_file = os.path.basename(input_dem_file)
-        filled_file_name = f"filled_{base_file}"
-        d8_ptr_file_name = f"d8_flow_{base_file}"
-        flow_accum_file_name = f"flow_{base_file}"
+    def _fill_quantized(self, dem: Raster, precision: float, tmp_dir: str) -> Raster:
+        """
+        Fill the depressions of a WhiteBox raster on a quantized copy of its data.
 
-        self.wbe.write_raster(filled, f"{filled_file_name}")
-        self.wbe.write_raster(d8_ptr, f"{d8_ptr_file_name}")
-        self.wbe.write_raster(flow_accum, f"{flow_accum_file_name}")
+        The filled depressions are tilted with `common.resolve_flats` by less than
+        half a step, like the flat fixing of WhiteBox's `fill_depressions`, so D8
+        still finds a downslope neighbour on them.
 
-        return filled_file_name, d8_ptr_file_name, flow_accum_file_name
+        Args:
+            dem (Raster): The DEM raster.
+            precision (float): Size of one quantization step, in elevation units.
+            tmp_dir (str): Directory for the filled raster, which must exist for as
+                long as the returned raster is used.
+
+        Returns:
+            Raster: The filled float64 DEM, on the same grid as `dem`.
+        """
+        from . import common
+
+        nodata = dem.metadata().nodata
+        levels, offset = common.quantize_dem(dem.to_numpy(), precision, nodata)
+        filled_levels = common.fill_depressions(levels, nodata_value=-1)
+        filled = common.dequantize_dem(filled_levels, offset, precision, nodata)
+        filled = common.resolve_flats(filled, precision / 2, nodata)
+        # A float64 base keeps the flat gradient, which float32 would round away
+        return Raster.from_numpy(
+            filled,
+            Raster.new_from_other(dem, data_type="f64"),
+            output_path=os.path.join(tmp_dir, "filled_quantized.tif"),
+        )
 
     def add_analyse_roi_widget(self):
         """
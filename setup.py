@@ -0,0 +1,42 @@
+"""Build script for the optional `road_flood_risk_map._hydro` extension.
+
+Project metadata lives in pyproject.toml; this file only declares the Cython
+kernels. When Cython or a C compiler is unavailable the package still installs
+and falls back to the numba / NumPy implementations.
+"""
+
+import sys
+
+from setuptools import setup
+
+try:
+    from Cython.Build import cythonize
+    from setuptools import Extension
+except ImportError:  # pragma: no cover - Cython is a build-time extra
+    ext_modules = []
+else:
+    if sys.platform == "win32":
+        compile_args = ["/O2", "/openmp"]
+        link_args = []
+    elif sys.platform == "darwin":
+        # Apple clang ships without OpenMP; prange then runs serially
+        compile_args = ["-O3"]
+        link_args = []
+    else:
+        compile_args = ["-O3", "-fopenmp"]
+        link_args = ["-fopenmp"]
+
+    ext_modules = cythonize(
+        [
+            Extension(
+                "road_flood_risk_map._hydro",
+                ["road_flood_risk_map/_hydro.pyx"],
+                extra_compile_args=compile_args,
+                extra_link_args=link_args,
+                optional=True,
+            )
+        ],
+        compiler_directives={"language_level": "3"},
+    )
+
+setup(ext_modules=ext_modules)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+
+"""Tests for the `road_flood_risk_map.common` module."""
+
+
+import unittest
+
+import numpy as np
+
+from road_flood_risk_map import common
+
+
+# A bowl draining through a notch at (0, 2), with a deeper pit inside
+BOWL = np.array(
+    [
+        [9, 9, 6, 9, 9],
+        [9, 5, 4, 5, 9],
+        [9, 4, 1, 4, 9],
+        [9, 5, 4, 5, 9],
+        [9, 9, 9, 9, 9],
+    ]
+)
+
+
+class TestComputeD8Direction(unittest.TestCase):
+    """Tests for `common.compute_d8_direction`."""
+
+    def test_points_to_steepest_neighbour(self):
+        """Each cell flows towards its steepest downslope neighbour."""
+        dem = np.array(
+            [
+                [9.0, 8.0, 7.0],
+                [8.0, 5.0, 4.0],
+                [7.0, 4.0, 0.0],
+            ]
+        )
+        d8 = common.compute_d8_direction(dem)
+        self.assertEqual(d8.dtype, np.int32)
+        self.assertEqual(d8[1, 1], 2)  # South-East
+        self.assertEqual(d8[0, 0], 2)
+        self.assertEqual(d8[0, 2], 4)  # South
+        self.assertEqual(d8[2, 0], 1)  # East
+
+    def test_nodata_cells(self):
+        """Nodata cells are marked -1 and never chosen as a receiver."""
+        dem = np.array(
+            [
+                [5.0, 5.0, 5.0],
+                [5.0, -9999.0, 5.0],
+                [5.0, 5.0, 1.0],
+            ]
+        )
+        d8 = common.compute_d8_direction(dem, nodata_value=-9999)
+        self.assertEqual(d8[1, 1], -1)
+        self.assertEqual(d8[1, 2], 4)
+        self.assertEqual(d8[2, 1], 1)
+
+    def test_matches_numpy_fallback(self):
+        """Whichever kernel is dispatched to agrees with the NumPy fallback."""
+        rng = np.random.default_rng(42)
+        dem = rng.integers(0, 5, size=(17, 23)).astype(np.float64)
+        dem[rng.random(dem.shape) < 0.1] = np.nan
+        np.testing.assert_array_equal(
+            common.compute_d8_direction(dem), common._d8_numpy(dem)
+        )
+
+    @unittest.skipIf(not common._HAS_NUMBA, "numba not installed")
+    def test_numba_kernel_matches_numpy(self):
+        """The numba kernel, called directly, agrees with the NumPy fallback."""
+        rng = np.random.default_rng(43)
+        elev = rng.integers(0, 5, size=(19, 21)).astype(np.float32)
+        elev[rng.random(elev.shape) < 0.1] = np.nan
+        out = np.empty(elev.shape, dtype=np.int32)
+        common._d8_kernel(elev, out, 0)
+        np.testing.assert_array_equal(out, common._d8_numpy(elev))
+
+
+class TestFillDepressions(unittest.TestCase):
+    """Tests for `common.fill_depressions`."""
+
+    def setUp(self):
+        """The bowl DEM and its filled surface."""
+        self.dem = BOWL.copy()
+        self.expected = np.array(
+            [
+                [9, 9, 6, 9, 9],
+                [9, 6, 6, 6, 9],
+                [9, 6, 6, 6, 9],
+                [9, 6, 6, 6, 9],
+                [9, 9, 9, 9, 9],
+            ]
+        )
+
+    def test_integer_dem(self):
+        """Integer DEMs are filled up to the spill elevation."""
+        filled = common.fill_depressions(self.dem)
+        np.testing.assert_array_equal(filled, self.expected)
+        self.assertEqual(filled.dtype, np.float32)
+
+    def test_float_dem(self):
+        """Float DEMs are filled up to the spill elevation."""
+        filled = common.fill_depressions(self.dem.astype(np.float64) + 0.5)
+        np.testing.assert_allclose(filled, self.expected + 0.5)
+
+    def test_no_depressions(self):
+        """A DEM without depressions is returned unchanged."""
+        dem = np.add.outer(np.arange(6.0), np.arange(4.0))
+        np.testing.assert_array_equal(common.fill_depressions(dem), dem)
+
+    def test_nodata_cells_are_outlets(self):
+        """Cells draining into nodata are not filled and nodata is preserved."""
+        dem = self.dem.copy()
+        dem[2, 2] = -9999
+        filled = common.fill_depressions(dem, nodata_value=-9999)
+        np.testing.assert_array_equal(filled, dem)
+
+    def test_tiled_matches_untiled(self):
+        """Filling tile by tile gives the same result as a single pass."""
+        rng = np.random.default_rng(7)
+        dem = rng.random((37, 29)) * 10
+        dem[rng.random(dem.shape) < 0.05] = np.nan
+        np.testing.assert_array_equal(
+            common.fill_depressions(dem, tile_size=8),
+            common.fill_depressions(dem),
+        )
+
+    def test_tiled_empty_dem(self):
+        """An empty DEM is returned as is, like the untiled fill does."""
+        filled = common.fill_depressions(np.zeros((0, 0)), tile_size=4)
+        self.assertEqual(filled.shape, (0, 0))
+
+    def test_parallel_matches_untiled(self):
+        """The process pool version gives the same result as a single pass."""
+        rng = np.random.default_rng(11)
+        dem = rng.random((31, 40)) * 10
+        dem[rng.random(dem.shape) < 0.05] = -9999
+        np.testing.assert_array_equal(
+            common.fill_depressions_parallel(
+                dem, nodata_value=-9999, tile_size=8, n_workers=2
+            ),
+            common.fill_depressions(dem, nodata_value=-9999),
+        )
+
+    def test_parallel_empty_dem(self):
+        """An empty DEM is returned without starting the process pool."""
+        filled = common.fill_depressions_parallel(np.zeros((0, 0)), n_workers=1)
+        self.assertEqual(filled.shape, (0, 0))
+        self.assertEqual(filled.dtype, np.float32)
+
+    @unittest.skipIf(not common._HAS_NUMBA, "numba not installed")
+    def test_numba_matches_python(self):
+        """The numba Priority-Flood and the pure Python fallback agree."""
+        rng = np.random.default_rng(6)
+        dem = (rng.random((23, 19)) * 10).astype(np.float32)
+        dem[rng.random(dem.shape) < 0.05] = np.nan
+        compiled = dem.copy()
+        common._priority_flood(compiled.ravel(), *dem.shape)
+        expected = dem.copy()
+        common._fill_depressions_python(expected)
+        np.testing.assert_array_equal(compiled, expected)
+
+    @unittest.skipIf(common._hydro is None, "compiled extension not built")
+    def test_compiled_matches_python(self):
+        """The Cython Priority-Flood and the pure Python fallback agree."""
+        rng = np.random.default_rng(5)
+        dem = (rng.random((23, 19)) * 10).astype(np.float32)
+        dem[rng.random(dem.shape) < 0.05] = np.nan
+        compiled = dem.copy()
+        common._hydro.priority_flood(compiled.ravel(), *dem.shape)
+        expected = dem.copy()
+        common._fill_depressions_python(expected)
+        np.testing.assert_array_equal(compiled, expected)
+
+
+class TestFillDepressionsFlowDirs(unittest.TestCase):
+    """Tests for `common.fill_depressions_flow_dirs`."""
+
+    def test_border_cells_flow_off_the_raster(self):
+        """Edges point outwards, with the corners pointing west or east."""
+        flow_dirs = common.fill_depressions_flow_dirs(np.zeros((4, 5)))
+        np.testing.assert_array_equal(flow_dirs[:, 0], 16)  # West
+        np.testing.assert_array_equal(flow_dirs[:, -1], 1)  # East
+        np.testing.assert_array_equal(flow_dirs[0, 1:-1], 64)  # North
+        np.testing.assert_array_equal(flow_dirs[-1, 1:-1], 4)  # South
+
+    def test_depression_routes_to_outlet(self):
+        """Flow leaves the bowl through the notch at (0, 2)."""
+        flow_dirs = common.fill_depressions_flow_dirs(BOWL.astype(np.float64))
+        self.assertEqual(flow_dirs[0, 2], 64)
+        self.assertEqual(flow_dirs[1, 2], 64)  # North, into the notch
+        self.assertEqual(flow_dirs[2, 2], 64)  # The pit drains towards it
+        self.assertEqual(flow_dirs[1, 1], 128)  # North-East
+        self.assertEqual(flow_dirs[1, 3], 32)  # North-West
+
+    def test_nodata_cells_are_outlets(self):
+        """Cells next to a nodata cell flow into it, as in `fill_depressions`."""
+        dem = BOWL.astype(np.float64)
+        dem[2, 2] = np.nan
+        flow_dirs = common.fill_depressions_flow_dirs(dem)
+        self.assertEqual(flow_dirs[2, 2], -1)
+        self.assertEqual(flow_dirs[1, 2], 4)  # South
+        self.assertEqual(flow_dirs[3, 2], 64)  # North
+        self.assertEqual(flow_dirs[2, 1], 1)  # East
+        self.assertEqual(flow_dirs[1, 1], 2)  # South-East
+
+
+class TestMonotoneBucketQueue(unittest.TestCase):
+    """Tests for `common.MonotoneBucketQueue`."""
+
+    def test_pops_in_key_order(self):
+        """Items come out lowest key first, and popping an empty queue raises."""
+        queue = common.MonotoneBucketQueue(-2, 3)
+        for z, idx in [(3, 0), (-2, 1), (1, 2), (1, 3)]:
+            queue.push(z, idx)
+        self.assertEqual(len(queue), 4)
+        keys = [queue.pop_min()[0] for _ in range(4)]
+        self.assertEqual(keys, [-2, 1, 1, 3])
+        with self.assertRaises(IndexError):
+            queue.pop_min()
+
+    @unittest.skipIf(not common._HAS_NUMBA, "numba not installed")
+    def test_numba_bucket_fill_matches_python(self):
+        """The numba bucket-queue Priority-Flood agrees with the Python fill."""
+        rng = np.random.default_rng(4)
+        dem = rng.integers(-5, 20, size=(22, 25)).astype(np.float32)
+        dem[rng.random(dem.shape) < 0.05] = np.nan
+        compiled = dem.copy()
+        min_z, n_levels = common._bucket_levels(dem)
+        common._priority_flood_buckets(compiled.ravel(), *dem.shape, min_z, n_levels)
+        expected = common._fill_depressions_python(dem.copy(), integer_dem=True)
+        np.testing.assert_array_equal(compiled, expected)
+
+    def test_bucket_levels(self):
+        """Bucket queues are only used when there are no more levels than cells."""
+        dem = np.array([[3.0, np.nan], [5.0, 4.0]], dtype=np.float32)
+        self.assertEqual(common._bucket_levels(dem), (3, 3))
+        dem[0, 0] = -1.0
+        self.assertIsNone(common._bucket_levels(dem))
+
+    def test_bucket_fill_matches_heap_fill(self):
+        """Both Python queues fill an integer DEM identically."""
+        rng = np.random.default_rng(3)
+        dem = rng.integers(-5, 20, size=(21, 26)).astype(np.float32)
+        dem[rng.random(dem.shape) < 0.05] = np.nan
+        buckets = common._fill_depressions_python(dem.copy(), integer_dem=True)
+        heap = common._fill_depressions_python(dem.copy(), integer_dem=False)
+        np.testing.assert_array_equal(buckets, heap)
+
+
+class TestQuantizeDEM(unittest.TestCase):
+    """Tests for `common.quantize_dem` and `common.dequantize_dem`."""
+
+    def test_round_trip(self):
+        """Levels fit in int16 and round trip to within half a step."""
+        dem = np.array([[101.234, 100.0], [-9999.0, 150.0]])
+        levels, offset = common.quantize_dem(dem, 0.01, nodata_value=-9999)
+        self.assertEqual(levels.dtype, np.int16)
+        self.assertEqual(offset, 100.0)
+        self.assertEqual(levels[1, 0], -1)
+        restored = common.dequantize_dem(levels, offset, 0.01, nodata_value=-9999)
+        np.testing.assert_allclose(restored, dem, atol=0.005)
+
+    def test_wide_range_uses_int32(self):
+        """Ranges over 32767 steps are stored as int32."""
+        levels, _ = common.quantize_dem(np.array([[0.0, 500.0]]), 0.01)
+        self.assertEqual(levels.dtype, np.int32)
+
+    def test_quantized_fill(self):
+        """Filling the levels matches the float fill to within half a step."""
+        rng = np.random.default_rng(9)
+        dem = rng.random((19, 17)) * 10
+        levels, offset = common.quantize_dem(dem, 0.01)
+        filled = common.dequantize_dem(
+            common.fill_depressions(levels, nodata_value=-1), offset, 0.01
+        )
+        self.assertEqual(filled.dtype, np.float64)
+        np.testing.assert_allclose(filled, common.fill_depressions(dem), atol=0.006)
+
+
+class TestResolveFlats(unittest.TestCase):
+    """Tests for `common.resolve_flats`."""
+
+    def test_filled_depression_drains_to_outlet(self):
+        """Every cell of a filled depression gets a strictly lower neighbour."""
+        filled = common.fill_depressions(BOWL)
+        tilted = common.resolve_flats(filled, 0.5)
+        self.assertLess(np.abs(tilted - filled).max(), 0.5)
+        self.assertEqual(tilted[0, 2], filled[0, 2])  # the outlet is not raised
+        for i in range(1, 4):
+            for j in range(1, 4):
+                window = tilted[i - 1 : i + 2, j - 1 : j + 2]
+                self.assertLess(window.min(), tilted[i, j])
+
+    def test_nodata_cells(self):
+        """Nodata cells are exits and keep their value."""
+        dem = np.full((6, 6), 9.0)
+        dem[1:5, 1:5] = 2.0
+        dem[1, 1] = -9999
+        tilted = common.resolve_flats(dem, 0.1, nodata_value=-9999)
+        self.assertEqual(tilted[1, 1], -9999)
+        self.assertEqual(tilted[2, 2], 2.0)
+        self.assertGreater(tilted[4, 4], tilted[3, 3])
+        self.assertGreater(tilted[3, 3], 2.0)
+        self.assertLess(tilted[4, 4], 2.1)
+
+
+class TestDEMArrays(unittest.TestCase):
+    """Tests for `common.DEMArrays`."""
+
+    def test_shared_buffers(self):
+        """The pipeline fills and routes in the preallocated buffers."""
+        dem = np.array([[3, 3, 3], [3, 1, 3], [3, 3, 2]], dtype=np.int16)
+        arrays = common.DEMArrays.from_dem(dem)
+        self.assertEqual(arrays.elev.dtype, np.float32)
+        self.assertTrue(arrays.elev.flags.c_contiguous)
+
+        filled = arrays.fill_depressions()
+        self.assertIs(filled, arrays.filled)
+        self.assertEqual(filled[1, 1], 2)
+        np.testing.assert_array_equal(arrays.elev, dem)
+
+        flow_dir = arrays.compute_d8_direction()
+        self.assertIs(flow_dir, arrays.flow_dir)
+        self.assertEqual(flow_dir[1, 1], 2)  # South-East, towards the outlet
+
+
+if __name__ == "__main__":
+    unittest.main()
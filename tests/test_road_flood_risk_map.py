@@ -3,7 +3,11 @@
 """Tests for `road_flood_risk_map` package."""
 
 
+import os
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
 from road_flood_risk_map import road_flood_risk_map
 
@@ -19,3 +23,143 @@ class TestRoad_flood_risk_map(unittest.TestCase):
 
     def test_000_something(self):
         """Test something."""
+
+
+class TestTiledExport(unittest.TestCase):
+    """Tests for the tile grid used by `road_flood_risk_map._export_tiled`."""
+
+    def test_tile_fits_download_limit(self):
+        """A tile at the derived size stays under the byte and dimension limits."""
+        for scale in (10, 30):
+            side_px = road_flood_risk_map._tile_deg(scale) * 111_320 / scale
+            self.assertLessEqual(
+                round(side_px) ** 2 * 8, road_flood_risk_map._EE_DOWNLOAD_LIMIT_BYTES
+            )
+        self.assertAlmostEqual(
+            road_flood_risk_map._tile_deg(30), 3 * road_flood_risk_map._tile_deg(10)
+        )
+        self.assertLessEqual(
+            road_flood_risk_map._tile_deg(10, bytes_per_pixel=1) * 111_320 / 10,
+            road_flood_risk_map._EE_DOWNLOAD_MAX_DIM,
+        )
+
+    def test_grid_covers_bounds(self):
+        """Tiles cover the bounds exactly, row by row, clipped at the far edges."""
+        tiles = road_flood_risk_map._tile_grid((0.0, 10.0, 1.0, 10.5), 0.4)
+        self.assertEqual(len(tiles), 6)
+        self.assertEqual(tiles[0], (0.0, 10.0, 0.4, 10.4))
+        self.assertEqual(tiles[2][2], 1.0)
+        self.assertEqual(tiles[-1][3], 10.5)
+        area = sum((e - w) * (n - s) for w, s, e, n in tiles)
+        self.assertAlmostEqual(area, 0.5)
+
+    def test_small_region_is_one_tile(self):
+        """A region that fits in one request is not split."""
+        tile_deg = road_flood_risk_map._tile_deg(10)
+        bounds = (5.0, 5.0, 5.0 + tile_deg / 2, 5.0 + tile_deg)
+        self.assertEqual(len(road_flood_risk_map._tile_grid(bounds, tile_deg)), 1)
+
+
+class TestExportTiled(unittest.TestCase):
+    """Tests for `road_flood_risk_map._export_tiled`, with downloads stubbed."""
+
+    def setUp(self):
+        """A temporary directory for the source tiles and the mosaic."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def fake_image(self):
+        """An image whose download URLs point at local GeoTIFFs, 10 px per degree."""
+        import numpy as np
+        import rasterio
+        from rasterio.transform import from_bounds
+
+        def get_download_url(params):
+            west, south, east, north = params["region"]
+            width = round((east - west) * 10)
+            height = round((north - south) * 10)
+            path = Path(self.tmp_dir.name, f"src_{west}_{south}.tif")
+            with rasterio.open(
+                path,
+                "w",
+                driver="GTiff",
+                width=width,
+                height=height,
+                count=1,
+                dtype="float32",
+                crs="EPSG:4326",
+                transform=from_bounds(west, south, east, north, width, height),
+            ) as dst:
+                dst.write(np.full((1, height, width), west + south, dtype="float32"))
+            return path.as_uri()
+
+        image = mock.Mock()
+        image.getDownloadURL.side_effect = get_download_url
+        return image
+
+    @mock.patch.object(road_flood_risk_map.ee.Geometry, "BBox", lambda *b: b)
+    def test_tiles_are_downloaded_and_mosaicked(self):
+        """Every tile is downloaded and the mosaic covers the whole bounds."""
+        import rasterio
+
+        image = self.fake_image()
+        output_path = os.path.join(self.tmp_dir.name, "out.tif")
+        road_flood_risk_map._export_tiled(
+            image, (0.0, 0.0, 1.2, 0.7), 30, output_path, tile_deg=0.5
+        )
+        self.assertEqual(image.getDownloadURL.call_count, 6)
+        with rasterio.open(output_path) as src:
+            mosaic = src.read(1)
+            self.assertEqual(mosaic.shape, (7, 12))
+            self.assertAlmostEqual(src.transform.a, 0.1)
+            self.assertAlmostEqual(src.transform.e, -0.1)
+            self.assertAlmostEqual(src.transform.c, 0.0)
+            self.assertAlmostEqual(src.transform.f, 0.7)
+        self.assertEqual(mosaic[-1, 0], 0.0)  # South-west tile
+        self.assertAlmostEqual(mosaic[0, -1], 1.5)  # North-east tile
+
+    @mock.patch.object(road_flood_risk_map, "_export_tiled")
+    @mock.patch.object(road_flood_risk_map.geemap, "ee_export_image")
+    def test_export_image_tiles_large_regions(self, export, tiled):
+        """Regions needing more than one tile at `scale` take the tiled path."""
+        ring = [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]
+        region = mock.Mock()
+        region.bounds().coordinates().get(0).getInfo.return_value = ring
+        image = mock.Mock()
+
+        road_flood_risk_map.RoadFloodRiskMap._export_image(
+            mock.Mock(), image, "large", region, 10
+        )
+        tiled.assert_called_once_with(
+            image,
+            (0.0, 0.0, 1.0, 1.0),
+            10,
+            "large.tif",
+            road_flood_risk_map._tile_deg(10),
+        )
+        export.assert_not_called()
+
+        tiled.reset_mock()
+        small = [[0.0, 0.0], [0.01, 0.0], [0.01, 0.01], [0.0, 0.01], [0.0, 0.0]]
+        region.bounds().coordinates().get(0).getInfo.return_value = small
+        road_flood_risk_map.RoadFloodRiskMap._export_image(
+            mock.Mock(), image, "small", region, 10
+        )
+        tiled.assert_not_called()
+        export.assert_called_once()
+        self.assertEqual(export.call_args.kwargs["filename"], "small.tif")
+
+
+class TestExportImage(unittest.TestCase):
+    """Tests for `RoadFloodRiskMap._export_image`."""
+
+    @mock.patch.object(road_flood_risk_map, "_export_tiled")
+    @mock.patch.object(road_flood_risk_map.geemap, "ee_export_image")
+    def test_nothing_exported_without_file_name(self, export, tiled):
+        """No download is attempted when the output file name is None or empty."""
+        for file_name in (None, ""):
+            road_flood_risk_map.RoadFloodRiskMap._export_image(
+                mock.Mock(), mock.Mock(), file_name, mock.Mock(), 30
+            )
+        export.assert_not_called()
+        tiled.assert_not_called()